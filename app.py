@@ -1,15 +1,26 @@
 import asyncio
-import json
+import contextlib
+import contextvars
+import copy
+import functools
+import heapq
+import itertools
 import logging
 import os
 import queue
 import re
 import shutil
-import subprocess
 import threading
 import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from urllib.parse import urlparse
 
+import aiohttp
+import msgspec
+import orjson
 import requests
+from cachetools import TTLCache
 from flask import (
     Flask,
     Response,
@@ -18,10 +29,21 @@ from flask import (
     request,
     stream_with_context,
 )
+from flask.json.provider import DefaultJSONProvider
+from requests.adapters import HTTPAdapter
 
 # Streamrip library imports
+from streamrip import progress as streamrip_progress
 from streamrip.client import DeezerClient, QobuzClient, SoundcloudClient, TidalClient
-from streamrip.config import Config
+from streamrip.config import (
+    DEFAULT_CONFIG_PATH,
+    Config,
+    OutdatedConfigError,
+    set_user_defaults,
+)
+from streamrip.db import Database, Downloads, Dummy, Failed
+from streamrip.media import track as streamrip_track
+from streamrip.rip.parse_url import parse_url
 
 # new logging config
 logging.basicConfig(
@@ -29,22 +51,147 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, used by jsonify and request.json"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 STREAMRIP_CONFIG = os.environ.get("STREAMRIP_CONFIG", "./config/config.toml")
 DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", "./music")
 MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", "2"))
+# Waiting downloads accepted before new ones are turned away with a 503
+MAX_QUEUED_DOWNLOADS = int(os.environ.get("MAX_QUEUED_DOWNLOADS", "1024"))
+# Seconds clients are asked to wait before retrying a full queue
+QUEUE_FULL_RETRY_AFTER = 5
+# Encoded once, these bodies never change between requests
+URL_REQUIRED_BODY = orjson.dumps({"error": "URL is required"})
+QUEUE_FULL_BODY = orjson.dumps(
+    {"error": "Download queue is full", "retry_after": QUEUE_FULL_RETRY_AFTER}
+)
+# Seconds a request thread waits for a search before giving up on it
+SEARCH_TIMEOUT = int(os.environ.get("SEARCH_TIMEOUT", "30"))
+# Pending messages per SSE client before it is considered too slow and dropped
+SSE_QUEUE_SIZE = 256
+# Most messages written to an SSE stream in a single chunk
+SSE_BATCH_SIZE = 32
+ALBUM_ART_CACHE_SIZE = 10000
+# Most items accepted by one /api/album-art-batch request
+ALBUM_ART_BATCH_LIMIT = 100
+AUDIO_EXTENSIONS = (".mp3", ".flac", ".m4a", ".opus")
+# Metadata lookups are reused for up to an hour
+METADATA_CACHE_SIZE = 2048
+METADATA_CACHE_TTL = 3600
+# Progress lines kept per download for the final output
+OUTPUT_LINES_LIMIT = 500
+# Most recently modified files returned by /api/browse
+BROWSE_LIMIT = 100
+
+# Services accepted by /api/download, matched against the URL host
+# youtube-dl for later
+VALID_HOSTS = frozenset(
+    {
+        "spotify.com",
+        "deezer.com",
+        "tidal.com",
+        "qobuz.com",
+        "soundcloud.com",
+        "youtube.com",
+    }
+)
 
-download_queue = queue.Queue()
+# Suffix of task ids, see new_task_id
+task_counter = itertools.count()
+# Consumed by download_worker coroutines on async_loop
+download_queue = asyncio.Queue()
 active_downloads = {}
-download_history = []
-sse_clients = []
-album_art_cache = {}
+# Most recent finished downloads, as reported by /api/status
+download_history = deque(maxlen=20)
+# SSE client queues keyed by id(queue)
+sse_clients: dict[int, queue.Queue] = {}
+sse_lock = threading.Lock()
+# LRU of (source, type, id) -> album art URL, guarded by cache_lock
+album_art_cache = OrderedDict()
 cache_lock = threading.Lock()
 
-# Initialize streamrip config and clients
+# Checked once at startup and kept up to date by /api/config, instead of
+# stat'ing the file on every request
+config_exists = os.path.exists(STREAMRIP_CONFIG)
+
+APP_ID_RE = re.compile(r'app_id\s*=\s*["\']?([^"\'\n]+)["\']?')
+# One pass over the URL instead of a substring scan per service
+SERVICE_URL_RE = re.compile(r"(spotify|qobuz|tidal|deezer)\.com")
+SPOTIFY_URL_RE = re.compile(r"/(album|track|playlist|artist)/([a-zA-Z0-9]+)")
+NUMERIC_URL_RE = re.compile(r"/(album|track|playlist|artist)/([0-9]+)")
+SOUNDCLOUD_TRACK_RE = re.compile(r"soundcloud:tracks:(\d+)")
+QOBUZ_FALLBACK_APP_ID = "950096963"
+QOBUZ_API_BASE = "https://www.qobuz.com/api.json/0.2"
+# media type -> (endpoint, id parameter) of the Qobuz "get" calls
+QOBUZ_GET_ENDPOINTS = {
+    "album": (f"{QOBUZ_API_BASE}/album/get", "album_id"),
+    "track": (f"{QOBUZ_API_BASE}/track/get", "track_id"),
+    "artist": (f"{QOBUZ_API_BASE}/artist/get", "artist_id"),
+}
+DEEZER_API_BASE = "https://api.deezer.com"
+DEEZER_ALBUM_URL = f"{DEEZER_API_BASE}/album/"
+DEEZER_TRACK_URL = f"{DEEZER_API_BASE}/track/"
+DEEZER_ARTIST_URL = f"{DEEZER_API_BASE}/artist/"
+# (config mtime, app_id) of the last successful lookup
+qobuz_app_id_cache = None
+
+# Sent on every metadata and album art API call. Both HTTP clients decode
+# br themselves once the brotli package is installed.
+API_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate, br",
+    "User-Agent": "streamrip-web/1.0",
+}
+
+# Shared keep-alive connection pool for the synchronous album art lookups.
+# No retries: these run on request threads and the client falls back to a
+# placeholder, so a slow or failing API must not hold the thread any longer.
+http_session = requests.Session()
+http_session.headers.update(API_HEADERS)
+http_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=0)
+http_session.mount("https://", http_adapter)
+http_session.mount("http://", http_adapter)
+
+# aiohttp session for lookups made on async_loop, created there on first use
+aio_session = None
+ALBUM_ART_TIMEOUT = aiohttp.ClientTimeout(total=3)
+
+# (service, type, id) -> metadata, only used from async_loop
+metadata_cache = TTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+# URL -> metadata for extract_metadata_from_url, also only used from async_loop
+url_metadata_cache = TTLCache(maxsize=METADATA_CACHE_SIZE, ttl=METADATA_CACHE_TTL)
+# Metadata lookups in flight, (service, type, id) -> Task. Also keeps the
+# tasks referenced until they finish. Only used from async_loop.
+metadata_inflight = {}
+
+# Initialize streamrip config and clients. The three are only replaced
+# together, on async_loop, see swap_streamrip.
 streamrip_config = None
 streamrip_clients = {}
+streamrip_db = None
+# Downloads and searches using each generation of clients, keyed by id() of
+# its streamrip_clients dict, and the replaced generations that are waiting
+# for their last user before their sessions are closed. Only used from
+# async_loop.
+streamrip_users = Counter()
+retired_clients = {}
+
+# Per-download progress sink, set inside the download coroutine so that
+# streamrip's progress callbacks can find the task they belong to
+download_progress_sink = contextvars.ContextVar("download_progress_sink", default=None)
+download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
 
 # Global event loop for async operations
 async_loop = None
@@ -69,8 +216,8 @@ def init_async_loop():
     logger.info("Async event loop initialized")
 
 
-def run_async(coro):
-    """Run a coroutine in the global event loop and wait for result"""
+def submit_async(coro):
+    """Schedule a coroutine on the global event loop and return its future"""
     global async_loop
 
     if async_loop is None:
@@ -78,35 +225,186 @@ def run_async(coro):
 
     # async_loop is guaranteed to be initialized here
     assert async_loop is not None
-    future = asyncio.run_coroutine_threadsafe(coro, async_loop)
-    return future.result(timeout=60)  # 60 second timeout
+    return asyncio.run_coroutine_threadsafe(coro, async_loop)
+
+
+def enqueue_download(task):
+    """Hand a task to the download workers, False if too many are waiting"""
+    if async_loop is None:
+        init_async_loop()
+
+    assert async_loop is not None
+    # download_queue itself stays unbounded so that put_nowait can never fail
+    # on the loop after the request has been answered. The limit is enforced
+    # here instead and can only be overshot by tasks enqueued concurrently.
+    if download_queue.qsize() >= MAX_QUEUED_DOWNLOADS:
+        return False
+    async_loop.call_soon_threadsafe(download_queue.put_nowait, task)
+    return True
+
+
+def queue_full_response():
+    response = json_response(QUEUE_FULL_BODY, status=503)
+    response.headers["Retry-After"] = str(QUEUE_FULL_RETRY_AFTER)
+    return response
+
+
+def run_async(coro, timeout=60):
+    """Run a coroutine in the global event loop and wait for result"""
+    future = submit_async(coro)
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        # Nobody is waiting for the result any more, stop the work on the loop
+        future.cancel()
+        raise
+
+
+def init_database(config):
+    """Build the streamrip downloads/failed database the same way `rip` does.
+
+    A database that is disabled, has no path (as in Config.defaults()) or
+    cannot be opened is replaced by Dummy, so downloads still work.
+    """
+    c = config.session.database
+    try:
+        downloads_db = (
+            Downloads(c.downloads_path)
+            if c.downloads_enabled and c.downloads_path
+            else Dummy()
+        )
+        failed_db = (
+            Failed(c.failed_downloads_path)
+            if c.failed_downloads_enabled and c.failed_downloads_path
+            else Dummy()
+        )
+    except Exception as e:
+        logger.error(f"Failed to open streamrip database, not tracking downloads: {e}")
+        return Database(Dummy(), Dummy())
+    return Database(downloads_db, failed_db)
+
+
+def load_streamrip_config():
+    """Load the streamrip config the same way the `rip` CLI does.
+
+    Without a file at STREAMRIP_CONFIG, rip's own default config is used and
+    created with the user defaults (downloads folder, database paths) if it
+    does not exist yet. Outdated config files are upgraded in place.
+    """
+    path = STREAMRIP_CONFIG
+    if not config_exists:
+        path = DEFAULT_CONFIG_PATH
+        logger.warning(f"Config not found at {STREAMRIP_CONFIG}, using {path}")
+        if not os.path.isfile(path):
+            logger.info(f"Creating default streamrip config at {path}")
+            set_user_defaults(path)
+
+    try:
+        config = Config(path)
+    except OutdatedConfigError as e:
+        logger.warning(f"{e} Auto-updating config file {path}")
+        Config.update_file(path)
+        config = Config(path)
+
+    logger.info(f"Loaded streamrip config from {path}")
+    return config
 
 
 def init_streamrip():
     """Initialize streamrip config and clients"""
-    global streamrip_config, streamrip_clients
-
     try:
-        if os.path.exists(STREAMRIP_CONFIG):
-            streamrip_config = Config(STREAMRIP_CONFIG)
-            logger.info(f"Loaded streamrip config from {STREAMRIP_CONFIG}")
-        else:
-            streamrip_config = Config.defaults()
-            logger.warning(f"Config not found at {STREAMRIP_CONFIG}, using defaults")
+        config = load_streamrip_config()
 
         # Initialize clients (will login on first use)
         # Clients expect Config object, which has .session attribute internally
-        streamrip_clients = {
-            "qobuz": QobuzClient(streamrip_config),
-            "deezer": DeezerClient(streamrip_config),
-            "tidal": TidalClient(streamrip_config),
-            "soundcloud": SoundcloudClient(streamrip_config),
+        clients = {
+            "qobuz": QobuzClient(config),
+            "deezer": DeezerClient(config),
+            "tidal": TidalClient(config),
+            "soundcloud": SoundcloudClient(config),
         }
         logger.info("Streamrip clients initialized")
     except Exception as e:
         logger.error(f"Failed to initialize streamrip: {e}")
-        streamrip_config = Config.defaults()
-        streamrip_clients = {}
+        config = Config.defaults()
+        clients = {}
+
+    # Kept out of the try above, a broken database must not cost the clients
+    db = init_database(config)
+    run_async(swap_streamrip(config, clients, db))
+
+
+async def swap_streamrip(config, clients, db):
+    """Install a new config, clients and database as one unit.
+
+    Runs on async_loop, so downloads and searches see either the old or the
+    new set, never a mix. The old clients' sessions are closed once nothing
+    is using them any more.
+    """
+    global streamrip_config, streamrip_clients, streamrip_db
+
+    old_clients = streamrip_clients
+    streamrip_config, streamrip_clients, streamrip_db = config, clients, db
+    if streamrip_users[id(old_clients)]:
+        retired_clients[id(old_clients)] = old_clients
+    else:
+        await close_client_sessions(old_clients)
+
+
+@contextlib.asynccontextmanager
+async def streamrip_session():
+    """The current (config, clients, db), kept open until the caller is done"""
+    clients = streamrip_clients
+    key = id(clients)
+    streamrip_users[key] += 1
+    try:
+        yield streamrip_config, clients, streamrip_db
+    finally:
+        streamrip_users[key] -= 1
+        if not streamrip_users[key]:
+            del streamrip_users[key]
+            if key in retired_clients:
+                await close_client_sessions(retired_clients.pop(key))
+
+
+async def close_client_sessions(clients):
+    """Close the aiohttp sessions of logged-in clients that have been replaced"""
+    for client in clients.values():
+        session = getattr(client, "session", None)
+        if client.logged_in and session is not None and not session.closed:
+            await session.close()
+
+
+def progress_callback(enabled, total, desc):
+    """Replacement for streamrip's get_progress_callback.
+
+    Inside a web download the progress is pushed as structured events into
+    the task's sink instead of drawing a terminal progress bar.
+    """
+    report = download_progress_sink.get()
+    if report is None:
+        return original_progress_callback(enabled, total, desc)
+
+    state = {"bytes": 0, "percent": -1}
+
+    def update(n):
+        state["bytes"] += n
+        percent = int(state["bytes"] * 100 / total) if total else 0
+        # Only report every 10% to keep the SSE stream quiet
+        if percent // 10 != state["percent"] // 10:
+            state["percent"] = percent
+            report({"track": desc, "bytes": state["bytes"], "total": total})
+
+    def done():
+        report({"track": desc, "bytes": total, "total": total, "done": True})
+
+    return streamrip_progress.Handle(update, done)
+
+
+original_progress_callback = streamrip_progress.get_progress_callback
+# track.py imports the function by name, so patch it there as well
+streamrip_progress.get_progress_callback = progress_callback
+streamrip_track.get_progress_callback = progress_callback
 
 
 # Initialize on startup
@@ -114,9 +412,9 @@ init_async_loop()
 init_streamrip()
 
 
-async def get_client(source):
+async def get_client(clients, source):
     """Get and login to a streamrip client"""
-    client = streamrip_clients.get(source)
+    client = clients.get(source)
     if not client:
         raise ValueError(f"Client not available for source: {source}")
 
@@ -130,136 +428,251 @@ async def get_client(source):
     return client
 
 
-class DownloadWorker(threading.Thread):
-    def __init__(self):
-        super().__init__(daemon=True)
-        self.current_process = None
+def config_for_quality(base_config, quality):
+    """Copy of the streamrip config with the quality overridden, like `rip -q`"""
+    config = copy.copy(base_config)
+    config.session = copy.deepcopy(base_config.session)
+    config.session.qobuz.quality = quality
+    config.session.tidal.quality = quality
+    config.session.deezer.quality = quality
+    config.session.soundcloud.quality = quality
+    return config
 
-    def run(self):
-        while True:
-            task = download_queue.get()
-            if task is None:
-                break
 
-            task_id = task["id"]
-            url = task["url"]
-            quality = task.get("quality", 3)
-            metadata = task.get("metadata", {})
+async def rip_url(url, quality, report):
+    """Resolve and download a URL with the shared, logged-in clients"""
+    parsed = parse_url(url)
+    if parsed is None:
+        raise ValueError(f"Unsupported URL: {url}")
+
+    async with streamrip_session() as (config, clients, db):
+        client = await get_client(clients, parsed.source)
+        token = download_progress_sink.set(report)
+        try:
+            pending = await parsed.into_pending(
+                client, config_for_quality(config, quality), db
+            )
+            media = await pending.resolve()
+            if media is None:
+                raise ValueError(f"Could not resolve {url}")
+            await media.rip()
+        finally:
+            download_progress_sink.reset(token)
+
+
+def format_progress(event):
+    if event.get("done"):
+        return f"{event['track']}: done"
+    if event["total"]:
+        percent = event["bytes"] * 100 // event["total"]
+        return f"{event['track']}: {percent}%"
+    return f"{event['track']}: {event['bytes']} bytes"
+
+
+async def do_download(task):
+    task_id = task["id"]
+    url = task["url"]
+    quality = task.get("quality", 3)
+    metadata = task.get("metadata")
+    metadata_lookup = None
+
+    async def resolve_metadata():
+        nonlocal metadata
+        metadata = await extract_metadata_from_url(url)
+        if task_id in active_downloads:
+            active_downloads[task_id]["metadata"] = metadata
+        broadcast_sse(
+            {"type": "download_metadata", "id": task_id, "metadata": metadata}
+        )
+
+    if metadata is None:
+        # Looked up alongside the download instead of holding up its start.
+        # The task only runs once this coroutine first yields, by which time
+        # the download has been registered and announced.
+        metadata = {}
+        metadata_lookup = asyncio.create_task(resolve_metadata())
+
+    active_downloads[task_id] = {
+        "status": "downloading",
+        "url": url,
+        "metadata": metadata,
+        "started": time.time(),
+    }
+
+    broadcast_sse(
+        {
+            "type": "download_started",
+            "id": task_id,
+            "metadata": metadata,
+            "status": "downloading",
+        }
+    )
+
+    # Only the tail of the log is kept, long playlists produce a lot of it
+    output_lines = deque(maxlen=OUTPUT_LINES_LIMIT)
+    recent_lines = deque(maxlen=5)
+
+    def report(event):
+        line = format_progress(event)
+        output_lines.append(line)
+        recent_lines.append(line)
+        broadcast_sse(
+            {
+                "type": "download_progress",
+                "id": task_id,
+                "output": "\n".join(recent_lines),
+                "progress": event,
+            }
+        )
 
-            active_downloads[task_id] = {
-                "status": "downloading",
+    def record(status, error=None):
+        download_history.append(
+            {
+                "id": task_id,
                 "url": url,
                 "metadata": metadata,
-                "started": time.time(),
+                "status": status,
+                "error": error,
+                "finished": time.time(),
             }
+        )
 
-            broadcast_sse(
-                {
-                    "type": "download_started",
-                    "id": task_id,
-                    "metadata": metadata,
-                    "status": "downloading",
-                }
-            )
+    try:
+        await rip_url(url, quality, report)
+        if metadata_lookup is not None:
+            # A failed lookup leaves the metadata empty, it never fails the task
+            await asyncio.gather(metadata_lookup, return_exceptions=True)
 
-            output_lines = []
-            process = None
+        record("completed")
+        broadcast_sse(
+            {
+                "type": "download_completed",
+                "id": task_id,
+                "status": "completed",
+                "metadata": metadata,
+                "output": "\n".join(output_lines),
+            }
+        )
 
-            try:
-                cmd = ["rip"]
-                if os.path.exists(STREAMRIP_CONFIG):
-                    cmd.extend(["--config-path", STREAMRIP_CONFIG])
-                cmd.extend(["-q", str(quality)])
-                cmd.extend(["url", url])
-
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True,
-                )
+    except Exception as e:
+        if metadata_lookup is not None:
+            # A failed lookup leaves the metadata empty, it never fails the task
+            await asyncio.gather(metadata_lookup, return_exceptions=True)
+        record("failed", str(e))
+        broadcast_sse(
+            {
+                "type": "download_error",
+                "id": task_id,
+                "error": str(e),
+                "output": "\n".join(output_lines) if output_lines else str(e),
+            }
+        )
 
-                self.current_process = process
-
-                for line in process.stdout:
-                    line = line.strip()
-                    if line:
-                        output_lines.append(line)
-                        if len(output_lines) % 10 == 0:
-                            broadcast_sse(
-                                {
-                                    "type": "download_progress",
-                                    "id": task_id,
-                                    "output": "\n".join(output_lines[-5:]),
-                                    "progress": {"raw_output": True},
-                                }
-                            )
-
-                process.wait()
-
-                broadcast_sse(
-                    {
-                        "type": "download_completed",
-                        "id": task_id,
-                        "status": "completed" if process.returncode == 0 else "failed",
-                        "metadata": metadata,
-                        "output": "\n".join(output_lines),
-                    }
-                )
+    finally:
+        active_downloads.pop(task_id, None)
 
-            except Exception as e:
-                broadcast_sse(
-                    {
-                        "type": "download_error",
-                        "id": task_id,
-                        "error": str(e),
-                        "output": "\n".join(output_lines) if output_lines else str(e),
-                    }
-                )
-
-            finally:
-                self.current_process = None
-                if task_id in active_downloads:
-                    del active_downloads[task_id]
-                if process and process.poll() is None:
-                    process.terminate()
 
+async def download_worker():
+    """Take tasks off download_queue for as long as the event loop runs"""
+    while True:
+        task = await download_queue.get()
+        try:
+            async with download_semaphore:
+                await do_download(task)
+        except Exception:
+            # One bad task must not take the worker down with it
+            logger.exception(f"Download task {task.get('id')} failed")
+        finally:
             download_queue.task_done()
 
 
-def broadcast_sse(data):
-    message = f"data: {json.dumps(data)}\n\n"
-    dead_clients = []
+def drop_stale_progress(client, task_id):
+    """Remove queued progress for a download that is about to be superseded"""
+    with client.mutex:
+        if client.queue:
+            client.queue = deque(item for item in client.queue if item[0] != task_id)
+
+
+def disconnect_sse_client(client):
+    """Throw away a lagging client's backlog and tell its stream to close"""
+    with client.mutex:
+        client.queue.clear()
+    client.put_nowait((None, None))
+
+
+def register_sse_client(client):
+    with sse_lock:
+        sse_clients[id(client)] = client
+
 
-    for client in sse_clients:
+def unregister_sse_clients(clients):
+    with sse_lock:
+        for client in clients:
+            sse_clients.pop(id(client), None)
+
+
+SSE_CONNECTED = f"data: {orjson.dumps({'type': 'connected'}).decode()}\n\n"
+
+
+def broadcast_sse(data):
+    message = f"data: {orjson.dumps(data).decode()}\n\n"
+    # Only the latest progress of a download is worth delivering
+    progress_id = data["id"] if data["type"] == "download_progress" else None
+    with sse_lock:
+        clients = list(sse_clients.values())
+    dead_clients = None
+
+    for client in clients:
+        if progress_id is not None:
+            drop_stale_progress(client, progress_id)
         try:
-            client.put(message)
-        except:
+            client.put_nowait((progress_id, message))
+        except queue.Full:
+            if dead_clients is None:
+                dead_clients = []
             dead_clients.append(client)
 
-    for client in dead_clients:
-        sse_clients.remove(client)
+    if dead_clients:
+        unregister_sse_clients(dead_clients)
+        for client in dead_clients:
+            disconnect_sse_client(client)
 
 
 @app.route("/api/events")
 def sse_events():
     def generate():
-        q = queue.Queue()
-        sse_clients.append(q)
+        q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+        register_sse_client(q)
 
         try:
-            yield f"data: {json.dumps({'type': 'connected'})}\n\n"
+            yield SSE_CONNECTED
 
             while True:
                 try:
-                    msg = q.get(timeout=30)
-                    yield msg
+                    _, msg = q.get(timeout=30)
                 except queue.Empty:
-                    continue  # previous heartbeat check
+                    # SSE comment line: ignored by EventSource, but keeps
+                    # proxies from timing out the idle connection
+                    yield ": keepalive\n\n"
+                    continue
+
+                # Flush whatever else is already queued in the same chunk
+                buf = []
+                while msg is not None:
+                    buf.append(msg)
+                    if len(buf) >= SSE_BATCH_SIZE:
+                        break
+                    try:
+                        _, msg = q.get_nowait()
+                    except queue.Empty:
+                        break
+                if buf:
+                    yield "".join(buf)
+                if msg is None:
+                    # Dropped for falling behind, the browser will reconnect
+                    return
         finally:
-            sse_clients.remove(q)
+            unregister_sse_clients([q])
 
     return Response(
         stream_with_context(generate()),
@@ -271,11 +684,18 @@ def sse_events():
     )
 
 
-workers = []
-for _ in range(MAX_CONCURRENT_DOWNLOADS):
-    worker = DownloadWorker()
-    worker.start()
-    workers.append(worker)
+download_workers = [
+    submit_async(download_worker()) for _ in range(MAX_CONCURRENT_DOWNLOADS)
+]
+
+
+def json_response(obj, status=200):
+    """jsonify for the large or frequently polled payloads, encoded with orjson.
+
+    Bodies that are already encoded, like URL_REQUIRED_BODY, are sent as is.
+    """
+    body = obj if isinstance(obj, bytes) else orjson.dumps(obj)
+    return Response(body, status=status, mimetype="application/json")
 
 
 @app.route("/")
@@ -283,6 +703,35 @@ def index():
     return render_template("index.html")
 
 
+def new_task_id():
+    # The counter keeps ids unique when two downloads are queued in the same
+    # clock tick, without paying for a uuid4's urandom call
+    return f"dl_{time.monotonic_ns()}_{next(task_counter)}"
+
+
+def with_scheme(url):
+    """Bare "open.qobuz.com/album/..." style input as an https URL.
+
+    streamrip's parse_url only recognizes URLs that have a scheme.
+    """
+    if "://" in url:
+        return url
+    return "https://" + url.lstrip("/")
+
+
+def is_supported_url(url):
+    """Check the URL's host (or a parent domain of it) against VALID_HOSTS"""
+    if not isinstance(url, str):
+        return False
+    try:
+        host = urlparse(with_scheme(url)).hostname or ""
+    except ValueError:
+        # Malformed netloc, e.g. an unclosed IPv6 bracket
+        return False
+    labels = host.split(".")
+    return any(".".join(labels[i:]) in VALID_HOSTS for i in range(len(labels) - 1))
+
+
 @app.route("/api/download", methods=["POST"])
 def start_download():
     data = request.json
@@ -290,37 +739,28 @@ def start_download():
     quality = data.get("quality", 3)
 
     if not url:
-        return jsonify({"error": "URL is required"}), 400
+        return json_response(URL_REQUIRED_BODY, status=400)
 
-    # Validate URL (basic check)
-    # youtube-dl for later
-    valid_services = [
-        "spotify.com",
-        "deezer.com",
-        "tidal.com",
-        "qobuz.com",
-        "soundcloud.com",
-        "youtube.com",
-    ]
-    if not any(service in url.lower() for service in valid_services):
-        return jsonify({"error": "Unsupported service URL"}), 400
+    if not is_supported_url(url):
+        return json_response({"error": "Unsupported service URL"}, status=400)
+    url = with_scheme(url)
 
-    metadata = extract_metadata_from_url(url)
-
-    task_id = f"dl_{int(time.time() * 1000)}"
-    task = {"id": task_id, "url": url, "quality": quality, "metadata": metadata}
+    # Metadata is looked up by the download worker, not while the client waits
+    task_id = new_task_id()
+    task = {"id": task_id, "url": url, "quality": quality, "metadata": None}
 
-    download_queue.put(task)
+    if not enqueue_download(task):
+        return queue_full_response()
 
-    return jsonify({"task_id": task_id, "status": "queued"})
+    return json_response({"task_id": task_id, "status": "queued"}, status=202)
 
 
 @app.route("/api/status")
 def get_all_status():
-    return jsonify(
+    return json_response(
         {
-            "active": active_downloads,
-            "history": download_history[-20:],
+            "active": dict(active_downloads),
+            "history": list(download_history),
             "queue_size": download_queue.qsize(),
         }
     )
@@ -328,10 +768,16 @@ def get_all_status():
 
 @app.route("/api/config", methods=["GET", "POST"])
 def config():
+    global config_exists, qobuz_app_id_cache
+
     if request.method == "GET":
-        if os.path.exists(STREAMRIP_CONFIG):
-            with open(STREAMRIP_CONFIG, "r") as f:
-                return jsonify({"config": f.read()})
+        if config_exists:
+            try:
+                with open(STREAMRIP_CONFIG, "r") as f:
+                    return jsonify({"config": f.read()})
+            except FileNotFoundError:
+                # Removed behind our back
+                config_exists = False
         return jsonify({"config": ""})
 
     elif request.method == "POST":
@@ -339,18 +785,163 @@ def config():
         config_content = data.get("config", "")
 
         try:
-            if os.path.exists(STREAMRIP_CONFIG):
+            # Not gated on config_exists, the file may have been created
+            # (e.g. by `rip config`) since that flag was last updated
+            try:
                 shutil.copy2(STREAMRIP_CONFIG, f"{STREAMRIP_CONFIG}.bak")
+            except FileNotFoundError:
+                pass  # nothing to back up
 
             os.makedirs(os.path.dirname(STREAMRIP_CONFIG), exist_ok=True)
             with open(STREAMRIP_CONFIG, "w") as f:
                 f.write(config_content)
+            config_exists = True
+
+            # Downloads run in-process, so pick up the new config right away
+            init_streamrip()
+            qobuz_app_id_cache = None
 
             return jsonify({"status": "success"})
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
 
+def field_name(value, key="name"):
+    """value[key] for nested objects, the value itself for plain strings"""
+    if isinstance(value, dict):
+        return value.get(key, "")
+    return value or ""
+
+
+def result_extractor(search_type, source):
+    """Build the function turning one raw search item into a result dict.
+
+    Everything that only depends on the search type and source, like the
+    URL prefix, is worked out once here instead of once per item.
+    """
+    prefix = url_prefix(source, search_type)
+
+    def ids(item):
+        item_id = str(item.get("id", ""))
+        return item_id, prefix + item_id if item_id else ""
+
+    if search_type == "album":
+
+        def extract(item):
+            item_id, url = ids(item)
+            artist = field_name(item.get("artist"))
+            title = item.get("title", "")
+
+            # Try multiple fields for year
+            year = (
+                item.get("year")
+                or item.get("released_at")
+                or item.get("release_date_original")
+                or item.get("release_date")
+                or ""
+            )
+            # If year is a timestamp, extract just the year
+            if year and isinstance(year, (int, float)):
+                year = datetime.fromtimestamp(year).year
+            elif year and isinstance(year, str) and len(year) >= 4:
+                year = year[:4]  # Extract first 4 chars (YYYY)
+
+            if "tracks_count" in item:
+                track_count = item["tracks_count"]
+            else:
+                track_count = item.get("track_count", "")
+
+            return {
+                "id": item_id,
+                "service": source,
+                "type": "album",
+                "artist": artist,
+                "title": title,
+                "desc": f"{title} by {artist}" if artist else title,
+                "url": url,
+                "album_art": item.get("cover", ""),
+                "year": str(year) if year else "",
+                "label": field_name(item.get("label")),
+                "track_count": track_count,
+            }
+
+    elif search_type == "track":
+
+        def extract(item):
+            item_id, url = ids(item)
+            artist = field_name(item.get("artist"))
+            title = item.get("title", "")
+            album = item.get("album")
+
+            return {
+                "id": item_id,
+                "service": source,
+                "type": "track",
+                "artist": artist,
+                "title": title,
+                "album": album.get("title", "") if isinstance(album, dict) else "",
+                "desc": f"{title} by {artist}" if artist else title,
+                "url": url,
+                "album_art": item.get("cover", ""),
+                "duration": item.get("duration", ""),
+            }
+
+    elif search_type == "artist":
+
+        def extract(item):
+            item_id, url = ids(item)
+            name = item.get("name", "")
+
+            return {
+                "id": item_id,
+                "service": source,
+                "type": "artist",
+                "artist": name,
+                "title": "",
+                "desc": name,
+                "url": url,
+                "album_art": item.get("picture") or item.get("image", ""),
+            }
+
+    elif search_type == "playlist":
+
+        def extract(item):
+            item_id, url = ids(item)
+            name = item.get("name") or item.get("title", "")
+            creator = item.get("creator")
+            creator = creator.get("name", "") if isinstance(creator, dict) else ""
+
+            return {
+                "id": item_id,
+                "service": source,
+                "type": "playlist",
+                "artist": creator,
+                "title": name,
+                "desc": f"{name} by {creator}" if creator else name,
+                "url": url,
+                "album_art": item.get("image", ""),
+                "track_count": item.get("tracks_count", ""),
+            }
+
+    else:
+        # Fallback for unknown types
+        def extract(item):
+            item_id, url = ids(item)
+
+            return {
+                "id": item_id,
+                "service": source,
+                "type": search_type,
+                "artist": "",
+                "title": str(item),
+                "desc": str(item),
+                "url": url,
+                "album_art": "",
+            }
+
+    return extract
+
+
 async def search_music_async(query, search_type, source):
     """Async function to search using streamrip library"""
     logger.info("=" * 60)
@@ -361,11 +952,12 @@ async def search_music_async(query, search_type, source):
     logger.info("=" * 60)
 
     try:
-        # Get the client for this source
-        client = await get_client(source)
+        async with streamrip_session() as (_, clients, _):
+            # Get the client for this source
+            client = await get_client(clients, source)
 
-        # Perform search using the client - returns list of page dicts
-        pages = await client.search(search_type, query, limit=100)
+            # Perform search using the client - returns list of page dicts
+            pages = await client.search(search_type, query, limit=100)
 
         logger.info(f"Search returned {len(pages)} pages")
 
@@ -380,8 +972,12 @@ async def search_music_async(query, search_type, source):
 
         logger.info(f"Extracted {len(search_results)} items from pages")
 
+        # The f-strings below are built eagerly, so skip them entirely
+        # unless debug logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+
         # Debug: log first result to see structure
-        if search_results:
+        if debug and search_results:
             logger.debug(f"First result structure: {search_results[0]}")
             logger.debug(
                 f"First result keys: {search_results[0].keys() if isinstance(search_results[0], dict) else 'Not a dict'}"
@@ -392,129 +988,11 @@ async def search_music_async(query, search_type, source):
                 for key, value in search_results[0].items():
                     logger.debug(f"  {key}: {value}")
 
-        results = []
-        for idx, item in enumerate(search_results):
-            # Extract metadata based on type
-            item_id = str(item.get("id", ""))
-
-            # Build result with more fields available from library
-            if search_type == "album":
-                artist = (
-                    item.get("artist", {}).get("name", "")
-                    if isinstance(item.get("artist"), dict)
-                    else item.get("artist", "")
-                )
-                title = item.get("title", "")
-                desc = f"{title} by {artist}" if artist else title
-
-                # Try multiple fields for year
-                year = (
-                    item.get("year", "")
-                    or item.get("released_at", "")
-                    or item.get("release_date_original", "")
-                    or item.get("release_date", "")
-                    or ""
-                )
-                # If year is a timestamp, extract just the year
-                if year and isinstance(year, (int, float)):
-                    from datetime import datetime
-
-                    year = datetime.fromtimestamp(year).year
-                elif year and isinstance(year, str) and len(year) >= 4:
-                    year = year[:4]  # Extract first 4 chars (YYYY)
-
-                result_item = {
-                    "id": item_id,
-                    "service": source,
-                    "type": "album",
-                    "artist": artist,
-                    "title": title,
-                    "desc": desc,
-                    "url": construct_url(source, "album", item_id),
-                    "album_art": item.get("cover", ""),
-                    "year": str(year) if year else "",
-                    "label": item.get("label", {}).get("name", "")
-                    if isinstance(item.get("label"), dict)
-                    else item.get("label", ""),
-                    "track_count": item.get(
-                        "tracks_count", item.get("track_count", "")
-                    ),
-                }
-            elif search_type == "track":
-                artist = (
-                    item.get("artist", {}).get("name", "")
-                    if isinstance(item.get("artist"), dict)
-                    else item.get("artist", "")
-                )
-                title = item.get("title", "")
-                album = (
-                    item.get("album", {}).get("title", "")
-                    if isinstance(item.get("album"), dict)
-                    else ""
-                )
-                desc = f"{title} by {artist}" if artist else title
-
-                result_item = {
-                    "id": item_id,
-                    "service": source,
-                    "type": "track",
-                    "artist": artist,
-                    "title": title,
-                    "album": album,
-                    "desc": desc,
-                    "url": construct_url(source, "track", item_id),
-                    "album_art": item.get("cover", ""),
-                    "duration": item.get("duration", ""),
-                }
-            elif search_type == "artist":
-                name = item.get("name", "")
-
-                result_item = {
-                    "id": item_id,
-                    "service": source,
-                    "type": "artist",
-                    "artist": name,
-                    "title": "",
-                    "desc": name,
-                    "url": construct_url(source, "artist", item_id),
-                    "album_art": item.get("picture", item.get("image", "")),
-                }
-            elif search_type == "playlist":
-                name = item.get("name", item.get("title", ""))
-                creator = (
-                    item.get("creator", {}).get("name", "")
-                    if isinstance(item.get("creator"), dict)
-                    else ""
-                )
-                desc = f"{name} by {creator}" if creator else name
-
-                result_item = {
-                    "id": item_id,
-                    "service": source,
-                    "type": "playlist",
-                    "artist": creator,
-                    "title": name,
-                    "desc": desc,
-                    "url": construct_url(source, "playlist", item_id),
-                    "album_art": item.get("image", ""),
-                    "track_count": item.get("tracks_count", ""),
-                }
-            else:
-                # Fallback for unknown types
-                result_item = {
-                    "id": item_id,
-                    "service": source,
-                    "type": search_type,
-                    "artist": "",
-                    "title": str(item),
-                    "desc": str(item),
-                    "url": construct_url(source, search_type, item_id),
-                    "album_art": "",
-                }
-
-            results.append(result_item)
-
-            if idx < 3:  # Log first 3 results
+        extract = result_extractor(search_type, source)
+        results = [extract(item) for item in search_results]
+
+        if debug:
+            for idx, result_item in enumerate(results[:3]):  # Log first 3 results
                 logger.debug(f"Result {idx + 1}: {result_item}")
 
         logger.info(f"Returning {len(results)} results")
@@ -550,9 +1028,11 @@ def search_music():
 
     try:
         # Run the async search function
-        results = run_async(search_music_async(query, search_type, source))
+        results = run_async(
+            search_music_async(query, search_type, source), timeout=SEARCH_TIMEOUT
+        )
 
-        return jsonify(
+        return json_response(
             {
                 "results": results,
                 "query": query,
@@ -561,6 +1041,10 @@ def search_music():
             }
         )
 
+    except TimeoutError:
+        logger.warning(f"Search timed out after {SEARCH_TIMEOUT}s: {source} '{query}'")
+        return jsonify({"error": f"Search on {source} timed out"}), 504
+
     except Exception as e:
         logger.exception(f"Unexpected error during search: {e}")
         error_msg = str(e)
@@ -585,164 +1069,289 @@ def get_album_art():
     if not all([source, media_type, item_id]):
         return jsonify({"error": "Missing parameters"}), 400
 
+    item_id = normalize_art_id(source, item_id)
+
+    try:
+        album_art = lookup_album_art(source, media_type, item_id)
+    except Exception as e:
+        logger.error(
+            f"Error fetching album art for {source}/{media_type}/{item_id}: {e}"
+        )
+        album_art = ""
+
+    return jsonify({"album_art": album_art})
+
+
+@app.route("/api/album-art-batch", methods=["POST"])
+def get_album_art_batch():
+    """Album art for many search results in one request, fetched concurrently"""
+    data = request.json
+    items = data.get("items") if isinstance(data, dict) else None
+
+    if not isinstance(items, list) or len(items) > ALBUM_ART_BATCH_LIMIT:
+        return jsonify(
+            {"error": f"items must be a list of at most {ALBUM_ART_BATCH_LIMIT}"}
+        ), 400
+
+    keys = []
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify({"error": "items must be objects"}), 400
+        source = item.get("source")
+        media_type = item.get("type")
+        item_id = item.get("id")
+        if not all([source, media_type, item_id]):
+            return jsonify({"error": "Missing parameters"}), 400
+        # Used in cache keys, so anything else would fail further down
+        if not (
+            isinstance(source, str)
+            and isinstance(media_type, str)
+            and isinstance(item_id, (str, int))
+        ):
+            return jsonify({"error": "Invalid parameters"}), 400
+        keys.append((source, media_type, normalize_art_id(source, str(item_id))))
+
+    app_id = get_qobuz_app_id() if any(k[0] == "qobuz" for k in keys) else None
+    album_art = run_async(batch_album_art(keys, app_id))
+    return jsonify({"album_art": album_art})
+
+
+def normalize_art_id(source, item_id):
     # Todo: handle SoundCloud special case and get correct albums if possible
     if source == "soundcloud":
         if "|" in item_id:
-            item_id = item_id.split("|")[0]
+            return item_id.split("|")[0]
         elif "soundcloud:tracks:" in item_id:
-            match = re.search(r"soundcloud:tracks:(\d+)", item_id)
+            match = SOUNDCLOUD_TRACK_RE.search(item_id)
             if match:
-                item_id = match.group(1)
+                return match.group(1)
+    return item_id
 
-    cache_key = f"{source}_{media_type}_{item_id}"
-    if cache_key in album_art_cache:
-        return jsonify({"album_art": album_art_cache[cache_key]})
 
-    try:
-        if source == "qobuz":
-            app_id = get_qobuz_app_id()
-            album_art = fetch_single_album_art(item_id, media_type, app_id)
-            if album_art:
-                album_art_cache[cache_key] = album_art
-                return jsonify({"album_art": album_art})
-            return jsonify({"album_art": ""})
-
-        elif source == "tidal":
-            if media_type == "artist":
-                album_art = f"https://resources.tidal.com/images/{item_id}/750x750.jpg"
-            else:
-                album_art = f"https://resources.tidal.com/images/{item_id}/320x320.jpg"
+def get_cached_album_art(cache_key):
+    with cache_lock:
+        album_art = album_art_cache.get(cache_key)
+        if album_art is not None:
+            album_art_cache.move_to_end(cache_key)
+        return album_art
 
-            if album_art:
-                album_art_cache[cache_key] = album_art
-                return jsonify({"album_art": album_art})
-            return jsonify({"album_art": ""})
 
-        elif source == "deezer":
-            if media_type == "artist":
-                try:
-                    response = requests.get(
-                        f"https://api.deezer.com/artist/{item_id}", timeout=3
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        album_art = data.get("picture_medium", data.get("picture", ""))
-                        if album_art:
-                            album_art_cache[cache_key] = album_art
-                            return jsonify({"album_art": album_art})
-                except:
-                    pass
-                return jsonify({"album_art": ""})
-            else:
-                album_art = f"https://api.deezer.com/{media_type}/{item_id}/image"
-                if album_art:
-                    album_art_cache[cache_key] = album_art
-                    return jsonify({"album_art": album_art})
-                return jsonify({"album_art": ""})
+def cache_album_art(cache_key, album_art):
+    # Misses are not cached so that transient API failures get retried
+    if not album_art:
+        return
+    with cache_lock:
+        album_art_cache[cache_key] = album_art
+        if len(album_art_cache) > ALBUM_ART_CACHE_SIZE:
+            album_art_cache.popitem(last=False)
 
-        elif source == "soundcloud":
-            # SoundCloud doesn't provide easy access to artwork
-            # Just return empty and let the frontend handle placeholders
-            return jsonify({"album_art": ""})
 
-        # Default return for unknown sources
-        return jsonify({"album_art": ""})
+def lookup_album_art(source, media_type, item_id):
+    """Album art URL for an item, served from the LRU cache when possible"""
+    cache_key = (source, media_type, item_id)
+    album_art = get_cached_album_art(cache_key)
+    if album_art is None:
+        album_art = fetch_album_art(source, media_type, item_id)
+        cache_album_art(cache_key, album_art)
+    return album_art
 
-    except Exception as e:
-        logger.error(
-            f"Error fetching album art for {source}/{media_type}/{item_id}: {e}"
+
+def fetch_album_art(source, media_type, item_id):
+    if source == "qobuz":
+        app_id = get_qobuz_app_id()
+        return fetch_single_album_art(item_id, media_type, app_id) or ""
+
+    elif source == "deezer" and media_type == "artist":
+        response = http_session.get(DEEZER_ARTIST_URL + item_id, timeout=3)
+        if response.status_code == 200:
+            data = orjson.loads(response.content)
+            return data.get("picture_medium", data.get("picture", ""))
+        return ""
+
+    return static_album_art(source, media_type, item_id)
+
+
+def static_album_art(source, media_type, item_id):
+    """Album art URLs that can be built without calling an API"""
+    if source == "tidal":
+        if media_type == "artist":
+            return f"https://resources.tidal.com/images/{item_id}/750x750.jpg"
+        return f"https://resources.tidal.com/images/{item_id}/320x320.jpg"
+
+    elif source == "deezer":
+        return f"{DEEZER_API_BASE}/{media_type}/{item_id}/image"
+
+    # SoundCloud doesn't provide easy access to artwork
+    # Just return empty and let the frontend handle placeholders
+    return ""
+
+
+async def get_aio_session():
+    global aio_session
+
+    if aio_session is None or aio_session.closed:
+        aio_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=64, limit_per_host=16, ttl_dns_cache=300
+            ),
+            timeout=aiohttp.ClientTimeout(total=5),
+            headers=API_HEADERS,
         )
-        return jsonify({"album_art": ""})
+    return aio_session
+
+
+async def fetch_album_art_async(session, source, media_type, item_id, app_id):
+    """Async counterpart of fetch_album_art, used by the batch endpoint"""
+    if source == "qobuz":
+        request_info = qobuz_art_request(item_id, media_type, app_id)
+        if request_info is None:
+            return ""
+        url, params = request_info
+        async with session.get(
+            url, params=params, timeout=ALBUM_ART_TIMEOUT
+        ) as response:
+            if response.status != 200:
+                return ""
+            data = orjson.loads(await response.read())
+        return extract_qobuz_art(data, media_type, item_id) or ""
+
+    elif source == "deezer" and media_type == "artist":
+        async with session.get(
+            DEEZER_ARTIST_URL + item_id, timeout=ALBUM_ART_TIMEOUT
+        ) as response:
+            if response.status != 200:
+                return ""
+            data = orjson.loads(await response.read())
+        return data.get("picture_medium", data.get("picture", ""))
+
+    return static_album_art(source, media_type, item_id)
+
+
+async def lookup_album_art_async(session, cache_key, app_id):
+    album_art = get_cached_album_art(cache_key)
+    if album_art is None:
+        try:
+            album_art = await fetch_album_art_async(session, *cache_key, app_id)
+        except Exception as e:
+            logger.error(f"Error fetching album art for {'/'.join(cache_key)}: {e}")
+            album_art = ""
+        cache_album_art(cache_key, album_art)
+    return album_art
+
+
+async def batch_album_art(keys, app_id):
+    session = await get_aio_session()
+    return await asyncio.gather(
+        *(lookup_album_art_async(session, key, app_id) for key in keys)
+    )
+
+
+def scan_audio_files(path):
+    """Yield (DirEntry, stat) for every audio file below path"""
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from scan_audio_files(entry.path)
+                elif entry.name.endswith(AUDIO_EXTENSIONS):
+                    try:
+                        stat = entry.stat()
+                    except OSError as e:
+                        # Broken symlinks and the like, keep scanning the rest
+                        logger.debug(f"Cannot stat {entry.path}: {e}")
+                        continue
+                    yield entry, stat
+    except OSError as e:
+        # Skip unreadable directories, like os.walk does
+        logger.debug(f"Cannot scan {path}: {e}")
 
 
 @app.route("/api/browse")
 def browse_downloads():
     try:
-        files = []
-        for root, dirs, filenames in os.walk(DOWNLOAD_DIR):
-            for filename in filenames:
-                if filename.endswith((".mp3", ".flac", ".m4a", ".opus")):
-                    filepath = os.path.join(root, filename)
-                    rel_path = os.path.relpath(filepath, DOWNLOAD_DIR)
-                    files.append(
-                        {
-                            "name": rel_path,
-                            "size": os.path.getsize(filepath),
-                            "modified": os.path.getmtime(filepath),
-                        }
-                    )
-
-        files.sort(key=lambda x: x["modified"], reverse=True)
-        return jsonify(files[:100])
+        newest = heapq.nlargest(
+            BROWSE_LIMIT,
+            scan_audio_files(DOWNLOAD_DIR),
+            key=lambda file: file[1].st_mtime,
+        )
+        files = [
+            {
+                "name": os.path.relpath(entry.path, DOWNLOAD_DIR),
+                "size": stat.st_size,
+                "modified": stat.st_mtime,
+            }
+            for entry, stat in newest
+        ]
+        return json_response(files)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-def fetch_single_album_art(item_id, media_type, app_id):
-    """Fetch album art for a single Qobuz item"""
-    try:
-        api_base = "https://www.qobuz.com/api.json/0.2"
-        endpoints = {
-            "album": f"{api_base}/album/get",
-            "track": f"{api_base}/track/get",
-            "artist": f"{api_base}/artist/get",
-        }
+def qobuz_art_request(item_id, media_type, app_id):
+    """(endpoint, params) of the Qobuz API call holding an item's image"""
+    endpoint = QOBUZ_GET_ENDPOINTS.get(media_type)
+    if endpoint is None:
+        return None
 
-        if media_type not in endpoints:
-            return None
+    url, id_param = endpoint
+    return url, {"app_id": app_id, id_param: item_id}
 
-        params = {"app_id": app_id}
-        if media_type == "album":
-            params["album_id"] = item_id
-        elif media_type == "track":
-            params["track_id"] = item_id
-        elif media_type == "artist":
-            params["artist_id"] = item_id
 
-        response = requests.get(endpoints[media_type], params=params, timeout=3)
-        if response.status_code != 200:
-            return None
+def extract_qobuz_art(data, media_type, item_id):
+    """Pick the best image URL out of a Qobuz album/track/artist response"""
+    # Check if we got a minimal response (no actual data)
+    if len(data) <= 2:
+        logger.debug(f"Minimal data for {media_type} {item_id}: {data}")
+        return None
 
-        data = response.json()
+    image_data = None
+
+    if media_type == "album" and "image" in data:
+        image_data = data["image"]
+    elif media_type == "track" and "album" in data and "image" in data["album"]:
+        image_data = data["album"]["image"]
+    elif media_type == "artist":
+        for field in ["image", "picture", "photo", "images", "thumbnail", "avatar"]:
+            if field in data:
+                image_data = data[field]
+                break
 
-        # Check if we got a minimal response (no actual data)
-        if len(data) <= 2:
-            logger.debug(f"Minimal data for {media_type} {item_id}: {data}")
+        if not image_data:
+            logger.debug(f"No image field found for artist {item_id}")
             return None
 
-        image_data = None
+    if not image_data:
+        return None
 
-        if media_type == "album" and "image" in data:
-            image_data = data["image"]
-        elif media_type == "track" and "album" in data and "image" in data["album"]:
-            image_data = data["album"]["image"]
-        elif media_type == "artist":
-            for field in ["image", "picture", "photo", "images", "thumbnail", "avatar"]:
-                if field in data:
-                    image_data = data[field]
-                    break
+    if isinstance(image_data, dict):
+        for size in ["extralarge", "large", "medium", "small", "thumbnail"]:
+            if size in image_data and image_data[size]:
+                url = image_data[size]
+                if url and isinstance(url, str) and url.startswith("http"):
+                    return url
+    elif isinstance(image_data, str) and image_data.startswith("http"):
+        return image_data
+    elif isinstance(image_data, list) and len(image_data) > 0:
+        for item in image_data:
+            if isinstance(item, str) and item.startswith("http"):
+                return item
 
-            if not image_data:
-                logger.debug(f"No image field found for artist {item_id}")
-                return None
+    return None
 
-        if not image_data:
+
+def fetch_single_album_art(item_id, media_type, app_id):
+    """Fetch album art for a single Qobuz item"""
+    try:
+        request_info = qobuz_art_request(item_id, media_type, app_id)
+        if request_info is None:
             return None
 
-        if isinstance(image_data, dict):
-            for size in ["extralarge", "large", "medium", "small", "thumbnail"]:
-                if size in image_data and image_data[size]:
-                    url = image_data[size]
-                    if url and isinstance(url, str) and url.startswith("http"):
-                        return url
-        elif isinstance(image_data, str) and image_data.startswith("http"):
-            return image_data
-        elif isinstance(image_data, list) and len(image_data) > 0:
-            for item in image_data:
-                if isinstance(item, str) and item.startswith("http"):
-                    return item
+        url, params = request_info
+        response = http_session.get(url, params=params, timeout=3)
+        if response.status_code != 200:
+            return None
 
-        return None
+        return extract_qobuz_art(orjson.loads(response.content), media_type, item_id)
 
     except Exception as e:
         logger.error(f"Error fetching album art for {media_type} {item_id}: {e}")
@@ -750,70 +1359,99 @@ def fetch_single_album_art(item_id, media_type, app_id):
 
 
 def get_qobuz_app_id():
+    global qobuz_app_id_cache
+
     try:
-        if os.path.exists(STREAMRIP_CONFIG):
+        try:
+            mtime = os.path.getmtime(STREAMRIP_CONFIG)
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime is not None:
+            if qobuz_app_id_cache and qobuz_app_id_cache[0] == mtime:
+                return qobuz_app_id_cache[1]
+
             with open(STREAMRIP_CONFIG, "r") as f:
                 config_content = f.read()
                 # logger.debug(f"Config file content: {config_content[:200]}...")  # First 200 chars
 
-            app_id_match = re.search(
-                r'app_id\s*=\s*["\']?([^"\'\n]+)["\']?', config_content
-            )
+            app_id_match = APP_ID_RE.search(config_content)
 
             if app_id_match:
                 app_id = app_id_match.group(1).strip()
                 logger.debug(f"Found app_id in config: {app_id}")
+                qobuz_app_id_cache = (mtime, app_id)
                 return app_id
             else:
                 logger.debug("No app_id found in config, using fallback")
 
         # Return a known working app_id as fallback
-        fallback_app_id = "950096963"
-        logger.debug(f"Using fallback app_id: {fallback_app_id}")
-        return fallback_app_id
+        logger.debug(f"Using fallback app_id: {QOBUZ_FALLBACK_APP_ID}")
+        return QOBUZ_FALLBACK_APP_ID
 
     except Exception as e:
         logger.error(f"Error extracting app_id: {e}")
-        return "950096963"
+        return QOBUZ_FALLBACK_APP_ID
+
+
+URL_PREFIXES = {
+    "qobuz": {
+        "album": "https://open.qobuz.com/album/",
+        "track": "https://open.qobuz.com/track/",
+        "artist": "https://open.qobuz.com/artist/",
+        "playlist": "https://open.qobuz.com/playlist/",
+    },
+    "tidal": {
+        "album": "https://tidal.com/browse/album/",
+        "track": "https://tidal.com/browse/track/",
+        "artist": "https://tidal.com/browse/artist/",
+        "playlist": "https://tidal.com/browse/playlist/",
+    },
+    "deezer": {
+        "album": "https://www.deezer.com/album/",
+        "track": "https://www.deezer.com/track/",
+        "artist": "https://www.deezer.com/artist/",
+        "playlist": "https://www.deezer.com/playlist/",
+    },
+    "soundcloud": {
+        "track": "https://soundcloud.com/",
+        "album": "https://soundcloud.com/",
+        "playlist": "https://soundcloud.com/",
+    },
+}
+
+
+def url_prefix(source, media_type):
+    """Everything of an item's URL except the trailing id"""
+    prefix = URL_PREFIXES.get(source, {}).get(media_type)
+    if prefix is None:
+        return f"https://open.{source}.com/{media_type}/"
+    return prefix
 
 
 def construct_url(source, media_type, item_id):
     if not item_id:
         return ""
+    return url_prefix(source, media_type) + item_id
 
-    url_patterns = {
-        "qobuz": {
-            "album": f"https://open.qobuz.com/album/{item_id}",
-            "track": f"https://open.qobuz.com/track/{item_id}",
-            "artist": f"https://open.qobuz.com/artist/{item_id}",
-            "playlist": f"https://open.qobuz.com/playlist/{item_id}",
-        },
-        "tidal": {
-            "album": f"https://tidal.com/browse/album/{item_id}",
-            "track": f"https://tidal.com/browse/track/{item_id}",
-            "artist": f"https://tidal.com/browse/artist/{item_id}",
-            "playlist": f"https://tidal.com/browse/playlist/{item_id}",
-        },
-        "deezer": {
-            "album": f"https://www.deezer.com/album/{item_id}",
-            "track": f"https://www.deezer.com/track/{item_id}",
-            "artist": f"https://www.deezer.com/artist/{item_id}",
-            "playlist": f"https://www.deezer.com/playlist/{item_id}",
-        },
-        "soundcloud": {
-            "track": f"https://soundcloud.com/{item_id}",
-            "album": f"https://soundcloud.com/{item_id}",
-            "playlist": f"https://soundcloud.com/{item_id}",
-        },
-    }
 
-    if source in url_patterns and media_type in url_patterns[source]:
-        return url_patterns[source][media_type]
+async def extract_metadata_from_url(url):
+    """Metadata for a download URL, reusing recent successful lookups"""
+    key = url.strip()
+    metadata = url_metadata_cache.get(key)
+    if metadata is not None:
+        return dict(metadata)
+
+    metadata = await lookup_metadata_from_url(key)
 
-    return f"https://open.{source}.com/{media_type}/{item_id}"
+    # Only lookups that found something are worth keeping, the rest are
+    # either cheap to redo or failed and should be retried
+    if metadata["title"]:
+        url_metadata_cache[key] = dict(metadata)
+    return metadata
 
 
-def extract_metadata_from_url(url):
+async def lookup_metadata_from_url(url):
     metadata = {
         "service": None,
         "type": None,
@@ -823,40 +1461,33 @@ def extract_metadata_from_url(url):
         "album_art": None,
     }
 
-    try:
-        if "spotify.com" in url:
-            metadata["service"] = "spotify"
-            match = re.search(r"/(album|track|playlist|artist)/([a-zA-Z0-9]+)", url)
-            if match:
-                metadata["type"] = match.group(1)
-                metadata["id"] = match.group(2)
-                # Note: Spotify requires OAuth for metadata, so we can't easily fetch it
+    service_match = SERVICE_URL_RE.search(url)
+    if service_match is None:
+        return metadata
+    service = metadata["service"] = service_match.group(1)
 
-        elif "qobuz.com" in url:
-            metadata["service"] = "qobuz"
-            match = re.search(r"/(album|track|playlist|artist)/([0-9]+)", url)
-            if match:
-                metadata["type"] = match.group(1)
-                metadata["id"] = match.group(2)
-                metadata.update(fetch_qobuz_metadata(metadata["id"], metadata["type"]))
+    try:
+        # Note: Spotify requires OAuth for metadata, so we can't easily fetch it
+        id_re = SPOTIFY_URL_RE if service == "spotify" else NUMERIC_URL_RE
+        match = id_re.search(url)
+        if match:
+            metadata["type"] = match.group(1)
+            metadata["id"] = match.group(2)
+
+            if service == "qobuz":
+                metadata.update(
+                    await fetch_qobuz_metadata_async(metadata["id"], metadata["type"])
+                )
 
-        elif "tidal.com" in url:
-            metadata["service"] = "tidal"
-            match = re.search(r"/(album|track|playlist|artist)/([0-9]+)", url)
-            if match:
-                metadata["type"] = match.group(1)
-                metadata["id"] = match.group(2)
+            elif service == "tidal":
                 metadata["album_art"] = (
                     f"https://resources.tidal.com/images/{metadata['id']}/320x320.jpg"
                 )
 
-        elif "deezer.com" in url:
-            metadata["service"] = "deezer"
-            match = re.search(r"/(album|track|playlist|artist)/([0-9]+)", url)
-            if match:
-                metadata["type"] = match.group(1)
-                metadata["id"] = match.group(2)
-                metadata.update(fetch_deezer_metadata(metadata["id"], metadata["type"]))
+            elif service == "deezer":
+                metadata.update(
+                    await fetch_deezer_metadata_async(metadata["id"], metadata["type"])
+                )
 
     except Exception as e:
         logger.error(f"Error extracting metadata from URL: {e}")
@@ -864,44 +1495,126 @@ def extract_metadata_from_url(url):
     return metadata
 
 
-def fetch_qobuz_metadata(item_id, item_type):
+def cached_metadata(service):
+    """Cache a metadata coroutine's results in metadata_cache once they have a title.
+
+    Concurrent lookups of the same item share one request.
+    """
+
+    def decorator(fetch):
+        @functools.wraps(fetch)
+        async def wrapper(item_id, item_type):
+            key = (service, item_type, item_id)
+            metadata = metadata_cache.get(key)
+            if metadata is None:
+                lookup = metadata_inflight.get(key)
+                if lookup is None:
+                    lookup = asyncio.ensure_future(fetch(item_id, item_type))
+                    metadata_inflight[key] = lookup
+                    lookup.add_done_callback(lambda _: metadata_inflight.pop(key, None))
+                # Shielded: one caller giving up must not cancel it for the others
+                metadata = await asyncio.shield(lookup)
+                # An error body decodes to empty fields, keep retrying those
+                if metadata.get("title"):
+                    metadata_cache[key] = metadata
+            # Callers merge this into their own dicts, never hand out ours
+            return dict(metadata)
+
+        return wrapper
+
+    return decorator
+
+
+# Typed views of the metadata API responses. msgspec only decodes these
+# fields and skips everything else, tracklists included.
+class Artist(msgspec.Struct):
+    name: str = ""
+
+
+class QobuzImage(msgspec.Struct):
+    small: str | None = None
+    medium: str | None = None
+    large: str | None = None
+    thumbnail: str | None = None
+
+
+class QobuzAlbum(msgspec.Struct):
+    title: str = ""
+    artist: Artist | None = None
+    image: QobuzImage | None = None
+
+
+class QobuzTrack(msgspec.Struct):
+    title: str = ""
+    performer: Artist | None = None
+    album: QobuzAlbum | None = None
+
+
+class DeezerAlbum(msgspec.Struct):
+    title: str = ""
+    artist: Artist | None = None
+    cover_medium: str | None = None
+
+
+class DeezerTrack(msgspec.Struct):
+    title: str = ""
+    artist: Artist | None = None
+    album: DeezerAlbum | None = None
+
+
+def pick_qobuz_image(image):
+    """Qobuz image URL for download metadata, smallest available size first"""
+    if image is None:
+        return ""
+    return image.small or image.medium or image.large or image.thumbnail or ""
+
+
+def qobuz_album_metadata(album):
+    """Pull title, artist and cover out of a Qobuz album/get response"""
+    return {
+        "title": album.title,
+        "artist": album.artist.name if album.artist else "",
+        "album_art": pick_qobuz_image(album.image),
+    }
+
+
+def deezer_album_metadata(album):
+    """Pull title, artist and cover out of a Deezer /album response"""
+    return {
+        "title": album.title,
+        "artist": album.artist.name if album.artist else "",
+        "album_art": album.cover_medium or "",
+    }
+
+
+@cached_metadata("qobuz")
+async def fetch_qobuz_metadata_async(item_id, item_type):
     metadata = {}
     try:
         app_id = get_qobuz_app_id()
-        api_base = "https://www.qobuz.com/api.json/0.2"
+        session = await get_aio_session()
 
         if item_type == "album":
-            response = requests.get(
-                f"{api_base}/album/get",
-                params={"album_id": item_id, "app_id": app_id},
-                timeout=5,
-            )
-            if response.status_code == 200:
-                data = response.json()
-                metadata["title"] = data.get("title", "")
-                metadata["artist"] = data.get("artist", {}).get("name", "")
-                if "image" in data:
-                    for size in ["small", "medium", "large", "thumbnail"]:
-                        if size in data["image"]:
-                            metadata["album_art"] = data["image"][size]
-                            break
+            url, id_param = QOBUZ_GET_ENDPOINTS["album"]
+            async with session.get(
+                url, params={id_param: item_id, "app_id": app_id}
+            ) as response:
+                if response.status == 200:
+                    album = msgspec.json.decode(await response.read(), type=QobuzAlbum)
+                    metadata.update(qobuz_album_metadata(album))
 
         elif item_type == "track":
-            response = requests.get(
-                f"{api_base}/track/get",
-                params={"track_id": item_id, "app_id": app_id},
-                timeout=5,
-            )
-            if response.status_code == 200:
-                data = response.json()
-                metadata["title"] = data.get("title", "")
-                metadata["artist"] = data.get("performer", {}).get("name", "")
-                album = data.get("album", {})
-                if "image" in album:
-                    for size in ["small", "medium", "large", "thumbnail"]:
-                        if size in album["image"]:
-                            metadata["album_art"] = album["image"][size]
-                            break
+            url, id_param = QOBUZ_GET_ENDPOINTS["track"]
+            async with session.get(
+                url, params={id_param: item_id, "app_id": app_id}
+            ) as response:
+                if response.status == 200:
+                    track = msgspec.json.decode(await response.read(), type=QobuzTrack)
+                    metadata["title"] = track.title
+                    metadata["artist"] = track.performer.name if track.performer else ""
+                    metadata["album_art"] = pick_qobuz_image(
+                        track.album.image if track.album else None
+                    )
 
     except Exception as e:
         logger.error(f"Error fetching Qobuz metadata: {e}")
@@ -909,27 +1622,27 @@ def fetch_qobuz_metadata(item_id, item_type):
     return metadata
 
 
-def fetch_deezer_metadata(item_id, item_type):
+@cached_metadata("deezer")
+async def fetch_deezer_metadata_async(item_id, item_type):
     metadata = {}
     try:
-        api_base = "https://api.deezer.com"
+        session = await get_aio_session()
 
         if item_type == "album":
-            response = requests.get(f"{api_base}/album/{item_id}", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                metadata["title"] = data.get("title", "")
-                metadata["artist"] = data.get("artist", {}).get("name", "")
-                metadata["album_art"] = data.get("cover_medium", "")
+            async with session.get(DEEZER_ALBUM_URL + item_id) as response:
+                if response.status == 200:
+                    album = msgspec.json.decode(await response.read(), type=DeezerAlbum)
+                    metadata.update(deezer_album_metadata(album))
 
         elif item_type == "track":
-            response = requests.get(f"{api_base}/track/{item_id}", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                metadata["title"] = data.get("title", "")
-                metadata["artist"] = data.get("artist", {}).get("name", "")
-                album = data.get("album", {})
-                metadata["album_art"] = album.get("cover_medium", "")
+            async with session.get(DEEZER_TRACK_URL + item_id) as response:
+                if response.status == 200:
+                    track = msgspec.json.decode(await response.read(), type=DeezerTrack)
+                    metadata["title"] = track.title
+                    metadata["artist"] = track.artist.name if track.artist else ""
+                    metadata["album_art"] = (
+                        track.album.cover_medium if track.album else None
+                    ) or ""
 
     except Exception as e:
         logger.error(f"Error fetching Deezer metadata: {e}")
@@ -948,8 +1661,9 @@ def download_from_url():
     album_art = data.get("album_art")
     service = data.get("service")
 
-    if not url:
-        return jsonify({"error": "URL required"}), 400
+    if not url or not isinstance(url, str):
+        return json_response(URL_REQUIRED_BODY, status=400)
+    url = with_scheme(url)
 
     if title and artist and service:
         metadata = {
@@ -959,27 +1673,28 @@ def download_from_url():
             "service": service,
         }
     else:
-        metadata = extract_metadata_from_url(url)
+        # Looked up by the download worker, not while the client waits
+        metadata = None
 
-    task_id = f"dl_{int(time.time() * 1000)}"
+    task_id = new_task_id()
     task = {"id": task_id, "url": url, "quality": quality, "metadata": metadata}
 
-    download_queue.put(task)
+    if not enqueue_download(task):
+        return queue_full_response()
 
-    return jsonify({"task_id": task_id, "status": "queued", "metadata": metadata})
+    return json_response(
+        {"task_id": task_id, "status": "queued", "metadata": metadata}, status=202
+    )
 
 
-if __name__ == "__main__":
+def main():
+    """Run the Flask development server, see gunicorn.conf.py for production"""
     logger.info("Starting Streamrip Web application...")
     logger.info(f"Config path: {STREAMRIP_CONFIG}")
     logger.info(f"Download directory: {DOWNLOAD_DIR}")
     logger.info(f"Max concurrent downloads: {MAX_CONCURRENT_DOWNLOADS}")
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    app.run(host="0.0.0.0", port=5000, threaded=True, debug=False)
+
 
 if __name__ == "__main__":
-    logger.info("Starting Streamrip Web application...")
-    logger.info(f"Config path: {STREAMRIP_CONFIG}")
-    logger.info(f"Download directory: {DOWNLOAD_DIR}")
-    logger.info(f"Max concurrent downloads: {MAX_CONCURRENT_DOWNLOADS}")
-    app.run(host="0.0.0.0", port=5000, debug=False)
-    app.run(host="0.0.0.0", port=5000, debug=False)
+    main()
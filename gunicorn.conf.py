@@ -0,0 +1,13 @@
+import os
+
+bind = "0.0.0.0:5000"
+
+# Downloads, the SSE client registry and the streamrip clients all live in
+# the worker process, so a single worker has to serve every request.
+# Concurrency comes from threads instead; each open SSE stream holds one.
+workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+keepalive = 30
+timeout = 60
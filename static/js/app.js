@@ -34,6 +34,9 @@ function handleSSEMessage(data) {
     case "download_started":
       handleDownloadStarted(data);
       break;
+    case "download_metadata":
+      handleDownloadMetadata(data);
+      break;
     case "download_progress":
       handleDownloadProgress(data);
       break;
@@ -65,6 +68,17 @@ function handleDownloadStarted(data) {
   }
 }
 
+function handleDownloadMetadata(data) {
+  const download = activeDownloads.get(data.id);
+  if (download) {
+    download.metadata = data.metadata;
+
+    if (currentTab === "active") {
+      renderActiveDownloads();
+    }
+  }
+}
+
 function handleDownloadError(data) {
   const download = activeDownloads.get(data.id);
   if (download) {
@@ -570,54 +584,55 @@ document.getElementById("searchSource").addEventListener("change", function (e)
   }
 });
 
+function setAlbumArtPlaceholder(artElement, type) {
+  if (type === "artist") {
+    artElement.innerHTML = "👤";
+  } else if (type === "track") {
+    artElement.innerHTML = "🎵";
+  } else {
+    artElement.innerHTML = "▶";
+  }
+}
+
 async function loadAlbumArtForVisibleItems() {
-  const visibleItems = document.querySelectorAll(".search-result-item");
+  const visibleItems = Array.from(
+    document.querySelectorAll(".search-result-item"),
+  ).filter((item) => item.dataset.id);
 
-  for (const item of visibleItems) {
-    const itemId = item.dataset.id;
-    const source = item.dataset.source;
-    const type = item.dataset.type;
+  if (visibleItems.length === 0) return;
+
+  let albumArt = [];
+  try {
+    // One request for the whole page, the server fetches them concurrently
+    const response = await fetch("/api/album-art-batch", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({
+        items: visibleItems.map((item) => ({
+          source: item.dataset.source,
+          type: item.dataset.type,
+          id: item.dataset.id,
+        })),
+      }),
+    });
+    const data = await response.json();
+    albumArt = data.album_art || [];
+  } catch (error) {
+    console.error("Error loading album art:", error);
+  }
 
-    if (!itemId) continue;
+  visibleItems.forEach((item, index) => {
+    const artElement = document.getElementById(`art-${item.dataset.id}`);
+    if (!artElement) return;
 
-    try {
-      const response = await fetch(
-        `/api/album-art?source=${source}&type=${type}&id=${encodeURIComponent(itemId)}`,
-      );
-      const data = await response.json();
-      if (data.album_art) {
-        const artElement = document.getElementById(`art-${itemId}`);
-        if (artElement) {
-          artElement.classList.remove("placeholder");
-          artElement.innerHTML = `<img src="${data.album_art}" alt="Album art" class="result-album-art" onerror="this.parentElement.classList.add('placeholder'); this.parentElement.innerHTML='▶'">`;
-        }
-      } else {
-        const artElement = document.getElementById(`art-${itemId}`);
-        if (artElement && artElement.classList.contains("placeholder")) {
-          artElement.classList.add("loaded");
-          if (type === "artist") {
-            artElement.innerHTML = "👤";
-          } else if (type === "track") {
-            artElement.innerHTML = "🎵";
-          } else {
-            artElement.innerHTML = "▶";
-          }
-        }
-      }
-    } catch (error) {
-      console.error("Error loading album art:", error);
-      const artElement = document.getElementById(`art-${itemId}`);
-      if (artElement && artElement.classList.contains("placeholder")) {
-        if (type === "artist") {
-          artElement.innerHTML = "👤";
-        } else if (type === "track") {
-          artElement.innerHTML = "🎵";
-        } else {
-          artElement.innerHTML = "▶";
-        }
-      }
+    if (albumArt[index]) {
+      artElement.classList.remove("placeholder");
+      artElement.innerHTML = `<img src="${albumArt[index]}" alt="Album art" class="result-album-art" onerror="this.parentElement.classList.add('placeholder'); this.parentElement.innerHTML='▶'">`;
+    } else if (artElement.classList.contains("placeholder")) {
+      artElement.classList.add("loaded");
+      setAlbumArtPlaceholder(artElement, item.dataset.type);
     }
-  }
+  });
 }
 
 async function downloadFromUrl(url, buttonElement) {